@@ -2,14 +2,22 @@
 import streamlit as st
 import pandas as pd
 from datetime import date, datetime, timedelta
-from fpdf import FPDF
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 import json
+import time
+import random
+import orjson
+import httpx
 from supabase import create_client, Client
+from postgrest.exceptions import APIError
 from typing import Optional, Dict, Any, Tuple, List
 import streamlit_authenticator as stauth
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 BOX_DEPOSIT_DEFAULT = 0.0
+SALES_PAGE_SIZE = 100
+FETCH_PAGE_SIZE = 1000  # Supabase's default PostgREST max-rows cap
 
 # ==================== CONFIGURATION ====================
 @st.cache_resource
@@ -21,7 +29,20 @@ def init_connection():
         else:
             url = st.secrets["SUPABASE_URL"]
             key = st.secrets["SUPABASE_KEY"]
-        return create_client(url, key)
+        client = create_client(url, key)
+        
+        # Reuse one keep-alive HTTP/2 session for all PostgREST calls so reruns
+        # don't pay a TCP/TLS handshake per request
+        session = client.postgrest.session
+        client.postgrest.session = httpx.Client(
+            base_url=session.base_url,
+            headers=session.headers,
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            http2=True,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60)
+        )
+        session.close()
+        return client
     except Exception as e:
         st.error(f"Connection failed: {e}")
         st.stop()
@@ -37,6 +58,9 @@ if 'edited_sales' not in st.session_state:
     st.session_state.edited_sales = pd.DataFrame()
 
 # ==================== AUTHENTICATION ====================
+# cache_data, not cache_resource: the authenticator writes login state into
+# the credentials dict, so every session needs its own copy
+@st.cache_data(show_spinner=False)
 def get_auth_config():
     try:
         if "auth" in st.secrets:
@@ -86,24 +110,64 @@ def safe_divide(num, denom, default=0.0):
 def format_currency(amount):
     return f"₹{amount:,.2f}"
 
-def clean_for_json(obj):
-    """Clean data for JSON serialization"""
-    if isinstance(obj, dict):
-        return {k: clean_for_json(v) for k, v in obj.items()}
-    elif pd.isna(obj):
+def changed_rows(orig_df, new_df):
+    """Positions of rows that differ between two aligned frames; NaN on both sides counts as unchanged"""
+    orig_df = orig_df.reset_index(drop=True)
+    new_df = new_df.reset_index(drop=True)
+    same = (orig_df == new_df) | (orig_df.isna() & new_df.isna())
+    return same.index[~same.all(axis=1)]
+
+def json_default(obj):
+    """Convert values orjson can't serialize natively (NaN floats already become null)"""
+    if obj is pd.NaT or obj is pd.NA:
         return None
     elif isinstance(obj, (pd.Timestamp, datetime, date)):
         return str(obj)
     elif hasattr(obj, 'item'):
         return obj.item()
-    else:
-        return obj
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def to_json(obj):
+    return orjson.dumps(obj, default=json_default, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+def execute_with_retry(query, attempts=3, base_delay=0.2):
+    """Execute a PostgREST query, retrying with jittered backoff when no connection could be obtained"""
+    for attempt in range(attempts):
+        try:
+            return query.execute()
+        except (httpx.PoolTimeout, httpx.ConnectError, httpx.ConnectTimeout):
+            if attempt == attempts - 1:
+                raise
+            time.sleep(random.uniform(0, base_delay * 2 ** attempt))
+
+def execute_concurrently(*queries):
+    """Run independent PostgREST queries in parallel; responses come back in order"""
+    with ThreadPoolExecutor(max_workers=len(queries)) as pool:
+        return list(pool.map(execute_with_retry, queries))
+
+def fetch_all_rows(build_query, page_size=FETCH_PAGE_SIZE):
+    """Every row of a query, paged with .range() so the server's max-rows cap can't truncate it"""
+    # build_query must return a fresh, uniquely ordered query so pages don't overlap
+    rows, offset = [], 0
+    while True:
+        response = execute_with_retry(build_query().range(offset, offset + page_size - 1))
+        page = response.data if response and hasattr(response, 'data') and response.data else []
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        offset += page_size
+
+def fetch_all_concurrently(*builders):
+    """fetch_all_rows for independent queries in parallel; row lists come back in order"""
+    with ThreadPoolExecutor(max_workers=len(builders)) as pool:
+        return list(pool.map(fetch_all_rows, builders))
 
 # ==================== CACHE FUNCTIONS ====================
-@st.cache_data(ttl=120, show_spinner=False)
+# Read-only frames: cache_resource hands out the cached object instead of a copy
+@st.cache_resource(ttl=120, show_spinner=False)
 def list_vendors():
     try:
-        response = supabase.table("vendors").select("*").order("name").execute()
+        response = supabase.table("vendors").select("id, name, contact").order("name").execute()
         if response and hasattr(response, 'data') and response.data:
             return pd.DataFrame(response.data)
     except:
@@ -111,66 +175,79 @@ def list_vendors():
     return pd.DataFrame(columns=['id', 'name', 'contact'])
 
 @st.cache_data(ttl=120, show_spinner=False)
-def list_fruits():
-    try:
-        response = supabase.table("stock").select("fruit, remaining").execute()
-        if response and hasattr(response, 'data') and response.data:
-            df = pd.DataFrame(response.data)
-            if 'fruit' in df.columns and 'remaining' in df.columns:
-                return sorted(df[df['remaining'] > 0]['fruit'].unique().tolist())
-    except:
-        pass
-    return []
+def vendor_ids_by_name() -> Dict[str, int]:
+    """Vendor name -> id lookup for the sell/return/payment forms"""
+    vendors_df = list_vendors()
+    return dict(zip(vendors_df['name'], vendors_df['id'].astype(int)))
 
 @st.cache_data(ttl=60, show_spinner=False)
+def recent_payments(limit=20):
+    """Latest payments with vendor names embedded by PostgREST; errors propagate so they aren't cached"""
+    response = supabase.table("payments").select("dt, amount, vendors(name)").order("dt", desc=True).limit(limit).execute()
+    if response and hasattr(response, 'data') and response.data:
+        df = pd.DataFrame(response.data)
+        df['Vendor'] = df.pop('vendors').map(lambda v: v.get('name') if isinstance(v, dict) else None)
+        return df[['dt', 'Vendor', 'amount']]
+    return pd.DataFrame()
+
+# Every stock write clears this, so the TTL only guards against outside edits
+@st.cache_data(ttl=300, show_spinner=False)
+def _stock_agg():
+    """Single stock read shared by get_current_stock and list_fruits; errors propagate so they aren't cached"""
+    # Only open lots: fully sold lots accumulate forever and add nothing
+    response = supabase.table("stock").select("fruit, remaining").gt("remaining", 0).execute()
+    if response and hasattr(response, 'data') and response.data:
+        df = pd.DataFrame(response.data)
+        by_fruit = df.groupby('fruit')['remaining'].sum().to_dict()
+        return {'by_fruit': by_fruit, 'fruits': tuple(sorted(by_fruit))}
+    return {'by_fruit': {}, 'fruits': ()}
+
+def list_fruits():
+    return list(_stock_agg()['fruits'])
+
 def get_current_stock():
-    try:
-        response = supabase.table("stock").select("fruit, remaining").execute()
-        if response and hasattr(response, 'data') and response.data:
-            df = pd.DataFrame(response.data)
-            if not df.empty:
-                return df.groupby('fruit')['remaining'].sum().to_dict()
-    except:
-        pass
-    return {}
+    return _stock_agg()['by_fruit']
 
-@st.cache_data(ttl=120, show_spinner=False)
+@st.cache_resource(ttl=120, show_spinner=False)
 def vendor_summary_table():
     try:
-        vendors = supabase.table("vendors").select("id, name").execute()
-        if not vendors or not hasattr(vendors, 'data') or not vendors.data:
+        # Whole tables for all vendors, fetched in parallel and aggregated
+        # client-side. Each table is paged so totals aren't cut off at the
+        # server's max-rows cap once it outgrows a single response.
+        vendors, sales, payments, returns = fetch_all_concurrently(
+            lambda: supabase.table("vendors").select("id, name").order("id"),
+            lambda: supabase.table("sales").select("vendor_id, total_price, box_deposit_collected").order("id"),
+            lambda: supabase.table("payments").select("vendor_id, amount").order("id"),
+            lambda: supabase.table("returns").select("vendor_id, box_deposit_refunded").order("id")
+        )
+        if not vendors:
             return pd.DataFrame()
         
-        rows = []
-        for v in vendors.data:
-            vid = v['id']
-            
-            sales = supabase.table("sales").select("*").eq("vendor_id", vid).execute()
-            sales_df = pd.DataFrame(sales.data if sales and hasattr(sales, 'data') and sales.data else [])
-            
-            payments = supabase.table("payments").select("amount").eq("vendor_id", vid).execute()
-            payments_df = pd.DataFrame(payments.data if payments and hasattr(payments, 'data') and payments.data else [])
-            
-            returns = supabase.table("returns").select("box_deposit_refunded").eq("vendor_id", vid).execute()
-            returns_df = pd.DataFrame(returns.data if returns and hasattr(returns, 'data') and returns.data else [])
-            
-            total_sales = safe_float(sales_df['total_price'].sum() if not sales_df.empty and 'total_price' in sales_df.columns else 0)
-            deposits_collected = safe_float(sales_df['box_deposit_collected'].sum() if not sales_df.empty and 'box_deposit_collected' in sales_df.columns else 0)
-            paid = safe_float(payments_df['amount'].sum() if not payments_df.empty and 'amount' in payments_df.columns else 0)
-            deposits_refunded = safe_float(returns_df['box_deposit_refunded'].sum() if not returns_df.empty and 'box_deposit_refunded' in returns_df.columns else 0)
-            
-            rows.append({
-                "vendor_id": vid,
-                "vendor_name": v['name'],
-                "total_sales": total_sales,
-                "payments": paid,
-                "net_due": total_sales - paid,
-                "deposits_collected": deposits_collected,
-                "deposits_refunded": deposits_refunded,
-                "net_deposits_held": deposits_collected - deposits_refunded
-            })
-        
-        return pd.DataFrame(rows)
+        sales_df = pd.DataFrame(sales, columns=['vendor_id', 'total_price', 'box_deposit_collected'])
+
+        payments_df = pd.DataFrame(payments, columns=['vendor_id', 'amount'])
+
+        returns_df = pd.DataFrame(returns, columns=['vendor_id', 'box_deposit_refunded'])
+
+        sales_agg = sales_df.groupby('vendor_id')[['total_price', 'box_deposit_collected']].sum()
+        paid_agg = payments_df.groupby('vendor_id')['amount'].sum()
+        refunded_agg = returns_df.groupby('vendor_id')['box_deposit_refunded'].sum()
+
+        summary = (
+            pd.DataFrame(vendors)
+            .rename(columns={'id': 'vendor_id', 'name': 'vendor_name'})
+            .join(sales_agg.rename(columns={'total_price': 'total_sales',
+                                            'box_deposit_collected': 'deposits_collected'}), on='vendor_id')
+            .join(paid_agg.rename('payments'), on='vendor_id')
+            .join(refunded_agg.rename('deposits_refunded'), on='vendor_id')
+        )
+        money_cols = ['total_sales', 'payments', 'deposits_collected', 'deposits_refunded']
+        summary[money_cols] = summary[money_cols].fillna(0).astype(float)
+        summary['net_due'] = summary['total_sales'] - summary['payments']
+        summary['net_deposits_held'] = summary['deposits_collected'] - summary['deposits_refunded']
+
+        return summary[['vendor_id', 'vendor_name', 'total_sales', 'payments', 'net_due',
+                        'deposits_collected', 'deposits_refunded', 'net_deposits_held']]
     except:
         return pd.DataFrame()
 
@@ -187,8 +264,7 @@ def add_stock(fruit, boxes, cost, dt=None):
             "remaining": int(boxes)
         }
         supabase.table("stock").insert(data).execute()
-        get_current_stock.clear()
-        list_fruits.clear()
+        _stock_agg.clear()
         return True
     except Exception as e:
         st.error(f"Error: {e}")
@@ -200,30 +276,27 @@ def reduce_stock_fifo(fruit, boxes_to_reduce):
         if not response or not hasattr(response, 'data') or not response.data:
             return False, f"No stock for {fruit}"
         
-        entries = sorted(response.data, key=lambda x: (x.get('date', ''), x.get('id', 0)))
-        remaining = boxes_to_reduce
-        
-        for entry in entries:
-            if remaining <= 0:
-                break
-            available = safe_int(entry.get('remaining', 0))
-            to_reduce = min(available, remaining)
-            new_remaining = available - to_reduce
-            
-            supabase.table("stock").update({"remaining": new_remaining}).eq("id", entry['id']).execute()
-            remaining -= to_reduce
-        
-        return remaining == 0, "Success" if remaining == 0 else f"Short by {remaining}"
+        # Oldest lots first; each lot gives what is still needed after the lots before it
+        lots = pd.DataFrame(response.data).sort_values(['date', 'id'])
+        available = pd.to_numeric(lots['remaining'], errors='coerce').fillna(0).astype(int)
+        if available.sum() < boxes_to_reduce:
+            return False, f"Insufficient stock. Available: {int(available.sum())}"
+
+        used_before = available.cumsum().shift(1, fill_value=0)
+        take = (boxes_to_reduce - used_before).clip(lower=0).clip(upper=available)
+        updates = [{**response.data[i], "remaining": int(available[i] - t)}
+                   for i, t in take[take > 0].items()]
+
+        # Write every touched lot back in a single request
+        supabase.table("stock").upsert(updates, on_conflict="id").execute()
+        _stock_agg.clear()
+        return True, "Success"
     except Exception as e:
         return False, str(e)
 
 def sell_to_vendor(dt, vendor_id, fruit, boxes, price, deposit, note=""):
     try:
-        stock = get_current_stock()
-        if boxes > stock.get(fruit, 0):
-            st.error(f"Insufficient stock. Available: {stock.get(fruit, 0)}")
-            return False
-        
+        # reduce_stock_fifo checks availability against live rows
         success, msg = reduce_stock_fifo(fruit, boxes)
         if not success:
             st.error(msg)
@@ -241,7 +314,41 @@ def sell_to_vendor(dt, vendor_id, fruit, boxes, price, deposit, note=""):
             "note": note
         }
         supabase.table("sales").insert(data).execute()
-        st.cache_data.clear()
+        vendor_summary_table.clear()
+        get_sales_for_editing.clear()
+        get_sales_report.clear()
+        get_daily_summary.clear()
+        return True
+    except Exception as e:
+        st.error(f"Error: {e}")
+        return False
+
+def save_sale_edits(rows):
+    """Write edited sales back in one upsert; each row carries the full sale so totals are recomputed"""
+    try:
+        payload = []
+        for row in rows:
+            boxes = safe_int(row.get('boxes', 0))
+            price = safe_float(row.get('price_per_box', 0))
+            deposit = safe_float(row.get('box_deposit_per_box', 0))
+            note = row.get('note')
+            payload.append({
+                "id": int(row['id']),
+                "dt": str(row.get('dt', '')),
+                "vendor_id": int(row['vendor_id']),
+                "fruit": str(row.get('fruit', '')),
+                "boxes": boxes,
+                "price_per_box": price,
+                "total_price": boxes * price,
+                "box_deposit_per_box": deposit,
+                "box_deposit_collected": boxes * deposit,
+                "note": "" if pd.isna(note) else str(note)
+            })
+        supabase.table("sales").upsert(payload, on_conflict="id").execute()
+        vendor_summary_table.clear()
+        get_sales_for_editing.clear()
+        get_sales_report.clear()
+        get_daily_summary.clear()
         return True
     except Exception as e:
         st.error(f"Error: {e}")
@@ -257,7 +364,7 @@ def record_return(dt, vendor_id, fruit, boxes, deposit, note=""):
             "box_deposit_refunded": int(boxes) * float(deposit),
             "note": note
         }
-        supabase.table("returns").insert(data).execute()
+        returned = supabase.table("returns").insert(data).execute()
         
         stock_data = {
             "fruit": fruit,
@@ -266,9 +373,16 @@ def record_return(dt, vendor_id, fruit, boxes, deposit, note=""):
             "date": dt,
             "remaining": int(boxes)
         }
-        supabase.table("stock").insert(stock_data).execute()
+        try:
+            supabase.table("stock").insert(stock_data).execute()
+        except Exception:
+            # Don't keep a return whose boxes never made it back into stock
+            if returned and hasattr(returned, 'data') and returned.data:
+                supabase.table("returns").delete().eq("id", returned.data[0]['id']).execute()
+            raise
         
-        st.cache_data.clear()
+        _stock_agg.clear()
+        vendor_summary_table.clear()
         return True
     except Exception as e:
         st.error(f"Error: {e}")
@@ -278,90 +392,114 @@ def record_payment(dt, vendor_id, amount, note=""):
     try:
         data = {"dt": dt, "vendor_id": int(vendor_id), "amount": float(amount), "note": note}
         supabase.table("payments").insert(data).execute()
+        recent_payments.clear()
         vendor_summary_table.clear()
+        get_daily_summary.clear()
         return True
     except Exception as e:
         st.error(f"Error: {e}")
         return False
 
 # ==================== CHANGE REQUEST FUNCTIONS (FIXED) ====================
-def submit_change_request(sale_id, current_data, requested_data, username, name, note=""):
-    """Submit a change request - DOES NOT apply changes, only creates request"""
+def submit_change_requests_bulk(changes, username, name, note=""):
+    """Submit (sale_id, current_data, requested_data) change requests in one insert, returns count"""
+    if not changes:
+        return 0
     try:
-        current_clean = clean_for_json(current_data)
-        requested_clean = clean_for_json(requested_data)
-        
-        request_data = {
+        request_rows = [{
             "requested_by": username,
             "requester_name": name,
             "sale_id": int(sale_id),
             "change_type": "edit_sale",
-            "current_data": json.dumps(current_clean),
-            "requested_data": json.dumps(requested_clean),
+            "current_data": to_json(current_data),
+            "requested_data": to_json(requested_data),
             "status": "pending",
             "note": note.strip() if note else ""
-        }
+        } for sale_id, current_data, requested_data in changes]
         
-        supabase.table("change_requests").insert(request_data).execute()
-        return True
+        supabase.table("change_requests").insert(request_rows).execute()
+        get_pending_requests.clear()
+        get_request_counts.clear()
+        get_user_requests.clear()
+        return len(request_rows)
         
     except Exception as e:
         st.error(f"Request failed: {e}")
-        return False
+        return 0
 
-def get_pending_requests(status="pending"):
-    try:
-        response = supabase.table("change_requests").select("*").eq("status", status).order("request_date", desc=True).execute()
-        if response and hasattr(response, 'data') and response.data:
-            return pd.DataFrame(response.data)
-    except:
-        pass
+@st.cache_data(ttl=30, show_spinner=False)
+def get_pending_requests(status="pending", columns="*"):
+    """Requests with one status, newest first; errors propagate so they aren't cached"""
+    response = supabase.table("change_requests").select(columns).eq("status", status).order("request_date", desc=True).execute()
+    if response and hasattr(response, 'data') and response.data:
+        return pd.DataFrame(response.data)
+    return pd.DataFrame()
+
+@st.cache_data(ttl=15, show_spinner=False)
+def get_user_requests(username, limit=10):
+    """Latest requests by one user, without the JSON payload columns; errors propagate so they aren't cached"""
+    response = (supabase.table("change_requests")
+                .select("id, sale_id, status, request_date, note, reviewed_by, admin_comment")
+                .eq("requested_by", username).order("request_date", desc=True).limit(limit).execute())
+    if response and hasattr(response, 'data') and response.data:
+        return pd.DataFrame(response.data)
     return pd.DataFrame()
 
 def approve_change_request(request_id, admin_username, comment=""):
     """Approve and APPLY changes - ONLY NOW changes are applied"""
     try:
-        req = supabase.table("change_requests").select("*").eq("id", request_id).execute()
-        if not req or not hasattr(req, 'data') or not req.data:
-            st.error("Request not found")
-            return False
-        
-        request = req.data[0]
-        
-        if request['status'] != 'pending':
-            st.warning(f"Request already {request['status']}")
-            return False
-        
-        requested_data = json.loads(request['requested_data'])
-        sale_id = request['sale_id']
-        
-        boxes = safe_int(requested_data.get('boxes', 0))
-        price = safe_float(requested_data.get('price_per_box', 0))
-        deposit = safe_float(requested_data.get('box_deposit_per_box', 0))
-        
-        update_data = {
-            'dt': str(requested_data.get('dt', '')),
-            'fruit': str(requested_data.get('fruit', '')),
-            'boxes': boxes,
-            'price_per_box': price,
-            'total_price': boxes * price,
-            'box_deposit_per_box': deposit,
-            'box_deposit_collected': boxes * deposit,
-            'note': str(requested_data.get('note', ''))
-        }
-        
-        # APPLY CHANGES TO SALES TABLE
-        supabase.table("sales").update(update_data).eq("id", sale_id).execute()
-        
-        # UPDATE REQUEST STATUS
-        supabase.table("change_requests").update({
+        # CLAIM THE REQUEST - only matches while still pending, returns the row
+        req = supabase.table("change_requests").update({
             "status": "approved",
             "reviewed_by": admin_username,
             "reviewed_date": datetime.now().isoformat(),
             "admin_comment": comment or "Approved"
-        }).eq("id", request_id).execute()
+        }).eq("id", request_id).eq("status", "pending").execute()
+        if not req or not hasattr(req, 'data') or not req.data:
+            st.warning("Request not found or already reviewed")
+            return False
+        
+        # Everything after the claim is undone by resetting the request,
+        # so a failure here can't leave it approved but unapplied
+        try:
+            request = req.data[0]
+            requested_data = json.loads(request['requested_data'])
+            sale_id = request['sale_id']
+            
+            boxes = safe_int(requested_data.get('boxes', 0))
+            price = safe_float(requested_data.get('price_per_box', 0))
+            deposit = safe_float(requested_data.get('box_deposit_per_box', 0))
+            
+            update_data = {
+                'dt': str(requested_data.get('dt', '')),
+                'fruit': str(requested_data.get('fruit', '')),
+                'boxes': boxes,
+                'price_per_box': price,
+                'total_price': boxes * price,
+                'box_deposit_per_box': deposit,
+                'box_deposit_collected': boxes * deposit,
+                'note': str(requested_data.get('note', ''))
+            }
+            
+            # APPLY CHANGES TO SALES TABLE
+            supabase.table("sales").update(update_data).eq("id", sale_id).execute()
+        except Exception:
+            # Put the request back so it can be reviewed again
+            supabase.table("change_requests").update({
+                "status": "pending",
+                "reviewed_by": None,
+                "reviewed_date": None,
+                "admin_comment": None
+            }).eq("id", request_id).execute()
+            raise
         
-        st.cache_data.clear()
+        vendor_summary_table.clear()
+        get_sales_for_editing.clear()
+        get_sales_report.clear()
+        get_daily_summary.clear()
+        get_pending_requests.clear()
+        get_request_counts.clear()
+        get_user_requests.clear()
         return True
         
     except Exception as e:
@@ -375,94 +513,272 @@ def reject_change_request(request_id, admin_username, comment):
             st.error("Rejection reason required")
             return False
         
-        req = supabase.table("change_requests").select("*").eq("id", request_id).execute()
-        if not req or not hasattr(req, 'data') or not req.data:
-            st.error("Request not found")
-            return False
-        
-        request = req.data[0]
-        
-        if request['status'] != 'pending':
-            st.warning(f"Request already {request['status']}")
-            return False
-        
         # ONLY UPDATE REQUEST STATUS - DO NOT TOUCH SALES
-        supabase.table("change_requests").update({
+        req = supabase.table("change_requests").update({
             "status": "rejected",
             "reviewed_by": admin_username,
             "reviewed_date": datetime.now().isoformat(),
             "admin_comment": comment.strip()
-        }).eq("id", request_id).execute()
+        }).eq("id", request_id).eq("status", "pending").execute()
+        if not req or not hasattr(req, 'data') or not req.data:
+            st.warning("Request not found or already reviewed")
+            return False
         
+        get_pending_requests.clear()
+        get_request_counts.clear()
+        get_user_requests.clear()
         return True
         
     except Exception as e:
         st.error(f"Rejection failed: {e}")
         return False
 
+@st.cache_data(ttl=30, show_spinner=False)
 def get_request_counts():
-    try:
-        response = supabase.table("change_requests").select("status").execute()
-        if response and hasattr(response, 'data') and response.data:
-            df = pd.DataFrame(response.data)
-            counts = df['status'].value_counts().to_dict()
-            return {
-                'pending': counts.get('pending', 0),
-                'approved': counts.get('approved', 0),
-                'rejected': counts.get('rejected', 0)
-            }
-    except:
-        pass
-    return {'pending': 0, 'approved': 0, 'rejected': 0}
+    """Request count per status; errors propagate so they aren't cached"""
+    counts = {'pending': 0, 'approved': 0, 'rejected': 0}
+    # head=True sends a HEAD request: only the count header comes back, no rows
+    responses = execute_concurrently(*[
+        supabase.table("change_requests").select("id", count="exact", head=True).eq("status", status)
+        for status in counts
+    ])
+    for status, response in zip(list(counts), responses):
+        counts[status] = safe_int(getattr(response, 'count', 0))
+    return counts
 
-def get_sales_for_editing(start, end):
-    try:
-        response = supabase.table("sales").select("*").gte("dt", start).lte("dt", end).order("dt", desc=True).execute()
-        if response and hasattr(response, 'data') and response.data:
-            df = pd.DataFrame(response.data)
-            vendors_df = list_vendors()
-            if not vendors_df.empty:
-                vendor_map = dict(zip(vendors_df['id'], vendors_df['name']))
-                df['vendor_name'] = df['vendor_id'].map(vendor_map)
-            return df
-    except:
-        pass
+@st.cache_data(ttl=60, show_spinner="Loading sales...")
+def get_sales_for_editing(start, end, page=1, page_size=SALES_PAGE_SIZE):
+    """One page of sales in the range, with vendor names embedded by PostgREST; errors propagate so they aren't cached"""
+    offset = (page - 1) * page_size
+    response = (supabase.table("sales").select("id, dt, vendor_id, fruit, boxes, price_per_box, box_deposit_per_box, note, vendors(name)")
+                .gte("dt", start).lte("dt", end)
+                # Many sales share a date; id makes the order, and so the pages, stable
+                .order("dt", desc=True).order("id", desc=True)
+                .range(offset, offset + page_size - 1).execute())
+    if response and hasattr(response, 'data') and response.data:
+        df = pd.DataFrame(response.data)
+        df['vendor_name'] = df.pop('vendors').map(lambda v: v.get('name') if isinstance(v, dict) else None)
+        return df
     return pd.DataFrame()
 
 # ==================== REPORTS ====================
+@st.cache_data(ttl=300, show_spinner="Loading sales...")
+def get_sales_report(start, end):
+    """Full sales rows in the range for the report and its export; errors propagate so they aren't cached"""
+    response = supabase.table("sales").select("*, vendors(name)").gte("dt", start).lte("dt", end).execute()
+    if response and hasattr(response, 'data') and response.data:
+        df = pd.DataFrame(response.data)
+        df['Vendor'] = df.pop('vendors').map(lambda v: v.get('name') if isinstance(v, dict) else None)
+        return df
+    return pd.DataFrame()
+
+@st.cache_data(ttl=60, show_spinner=False)
 def get_daily_summary(selected_date=None):
     if selected_date is None:
         selected_date = date.today()
     
     date_str = selected_date.isoformat()
     
-    try:
-        sales = supabase.table("sales").select("*").eq("dt", date_str).execute()
-        sales_df = pd.DataFrame(sales.data if sales and hasattr(sales, 'data') and sales.data else [])
-        
-        payments = supabase.table("payments").select("*").eq("dt", date_str).execute()
-        payments_df = pd.DataFrame(payments.data if payments and hasattr(payments, 'data') and payments.data else [])
-        
-        return {
-            "date": date_str,
-            "total_sales": safe_float(sales_df['total_price'].sum() if not sales_df.empty else 0),
-            "boxes_sold": safe_int(sales_df['boxes'].sum() if not sales_df.empty else 0),
-            "payments_received": safe_float(payments_df['amount'].sum() if not payments_df.empty else 0),
-            "num_transactions": len(sales_df) + len(payments_df)
-        }
-    except:
-        return None
+    # Only the summed columns come over the wire; errors propagate so a failed
+    # read isn't cached as an empty day
+    sales, payments = execute_concurrently(
+        supabase.table("sales").select("total_price, boxes").eq("dt", date_str),
+        supabase.table("payments").select("amount").eq("dt", date_str)
+    )
+    # A day's rows only feed a few sums; plain generators beat building DataFrames
+    sales_rows = sales.data if sales and hasattr(sales, 'data') and sales.data else []
+    payment_rows = payments.data if payments and hasattr(payments, 'data') and payments.data else []
+    
+    return {
+        "date": date_str,
+        "total_sales": sum(safe_float(r.get('total_price')) for r in sales_rows),
+        "boxes_sold": sum(safe_int(r.get('boxes')) for r in sales_rows),
+        "payments_received": sum(safe_float(r.get('amount')) for r in payment_rows),
+        "num_transactions": len(sales_rows) + len(payment_rows)
+    }
 
 def export_to_excel(df):
+    """Workbook bytes for df; runs inside a deferred download, so errors are raised, not rendered"""
+    buf = BytesIO()
+    with pd.ExcelWriter(buf, engine="xlsxwriter") as writer:
+        df.to_excel(writer, index=False)
+    return buf.getvalue()
+
+# ==================== EDIT FRAGMENTS ====================
+@st.fragment
+def admin_direct_edit():
+    """Admin direct-edit panel; widget changes rerun only this fragment"""
+    st.subheader("Direct Edit")
+    st.warning("⚠️ Immediate changes")
+
+    col1, col2, col3 = st.columns(3)
+    start = col1.date_input("From", value=date.today().replace(day=1), key="admin_direct_start")
+    end = col2.date_input("To", value=date.today(), key="admin_direct_end")
+    page = col3.number_input("Page", min_value=1, value=1, key="admin_direct_page")
+
+    if st.button("Load", key="admin_load"):
+        try:
+            sales_df = get_sales_for_editing(start.isoformat(), end.isoformat(), int(page))
+        except (APIError, httpx.HTTPError) as e:
+            st.error(f"Error: {e}")
+        else:
+            if not sales_df.empty:
+                st.session_state.edited_sales = sales_df
+                st.session_state.edit_mode = True
+            else:
+                st.warning("No sales")
+
+    if st.session_state.edit_mode and not st.session_state.edited_sales.empty:
+        edit_cols = ['id', 'dt', 'vendor_name', 'fruit', 'boxes', 'price_per_box', 'box_deposit_per_box']
+        display_df = st.session_state.edited_sales[edit_cols]
+
+        edited_df = st.data_editor(
+            display_df,
+            use_container_width=True,
+            num_rows="fixed",
+            hide_index=True,
+            key="admin_editor",
+            column_config={
+                'id': st.column_config.NumberColumn('ID', disabled=True),
+                'dt': st.column_config.TextColumn('Date', disabled=True),
+                'vendor_name': st.column_config.TextColumn('Vendor', disabled=True)
+            }
+        )
+
+        if st.button("💾 Save", type="primary", key="admin_save"):
+            orig_df = st.session_state.edited_sales.reset_index(drop=True)
+            new_df = edited_df.reset_index(drop=True)
+            changed_idx = changed_rows(orig_df[edit_cols], new_df)
+
+            if len(changed_idx) == 0:
+                st.info("No changes")
+            else:
+                # Edited values over the untouched columns (vendor_id, note) of the same rows
+                rows = orig_df.iloc[changed_idx].copy()
+                rows[edit_cols] = new_df.iloc[changed_idx]
+                if save_sale_edits(rows.to_dict(orient='records')):
+                    st.success(f"Saved {len(changed_idx)} sale(s)")
+                    st.session_state.edit_mode = False
+                    st.rerun()
+
+@st.fragment
+def user_edit_requests():
+    """User edit-and-submit panel; widget changes rerun only this fragment"""
+    col1, col2, col3 = st.columns(3)
+    start = col1.date_input("From", value=date.today().replace(day=1), key="user_start")
+    end = col2.date_input("To", value=date.today(), key="user_end")
+    page = col3.number_input("Page", min_value=1, value=1, key="user_page")
+
+    if st.button("Load", key="user_load"):
+        try:
+            sales_df = get_sales_for_editing(start.isoformat(), end.isoformat(), int(page))
+        except (APIError, httpx.HTTPError) as e:
+            st.error(f"Error: {e}")
+        else:
+            if not sales_df.empty:
+                st.session_state.user_edit_sales = sales_df
+            else:
+                st.warning("No sales")
+
+    if 'user_edit_sales' in st.session_state and not st.session_state.user_edit_sales.empty:
+        st.warning("⚠️ Changes require approval")
+
+        edit_cols = ['id', 'dt', 'vendor_name', 'fruit', 'boxes', 'price_per_box', 'box_deposit_per_box']
+        display_df = st.session_state.user_edit_sales[edit_cols]
+
+        edited_df = st.data_editor(
+            display_df,
+            use_container_width=True,
+            hide_index=True,
+            key="user_editor",
+            column_config={
+                'id': st.column_config.NumberColumn('ID', disabled=True),
+                'dt': st.column_config.TextColumn('Date', disabled=True),
+                'vendor_name': st.column_config.TextColumn('Vendor', disabled=True)
+            }
+        )
+
+        reason = st.text_area("Reason *", key="user_reason")
+
+        if st.button("📤 Submit", type="primary", key="user_submit"):
+            if not reason.strip():
+                st.error("Reason required")
+            else:
+                orig_df = st.session_state.user_edit_sales[edit_cols].reset_index(drop=True)
+                new_df = edited_df.reset_index(drop=True)
+                changed_idx = changed_rows(orig_df, new_df)
+
+                current_rows = orig_df.iloc[changed_idx].to_dict(orient='records')
+                requested_rows = new_df.iloc[changed_idx].to_dict(orient='records')
+                changes = [(int(requested['id']), current, requested)
+                           for current, requested in zip(current_rows, requested_rows)]
+
+                submitted = submit_change_requests_bulk(changes, username, name, reason)
+
+                if submitted > 0:
+                    st.success(f"✓ Submitted {submitted} request(s)")
+                    del st.session_state.user_edit_sales
+                    st.rerun()
+
+# ==================== REPORT FRAGMENTS ====================
+@st.fragment
+def reports_panel():
+    """Sales report for a date range; date and page changes rerun only this fragment"""
+    col1, col2 = st.columns(2)
+    start = col1.date_input("From", value=date.today().replace(day=1), key="report_start")
+    end = col2.date_input("To", value=date.today(), key="report_end")
+    
+    # Only the query can fail for outside reasons; rendering bugs should surface
     try:
-        buf = BytesIO()
-        with pd.ExcelWriter(buf, engine="openpyxl") as writer:
-            df.to_excel(writer, index=False)
-        buf.seek(0)
-        return buf
-    except Exception as e:
-        st.error(f"Export error: {e}")
-        return BytesIO()
+        df = get_sales_report(start.isoformat(), end.isoformat())
+    except (APIError, httpx.HTTPError) as e:
+        st.error(f"Error: {e}")
+        return
+    
+    if df.empty:
+        st.info("No sales")
+        return
+    
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Revenue", format_currency(df['total_price'].sum()))
+    col2.metric("Boxes", str(df['boxes'].sum()))
+    col3.metric("Avg", format_currency(safe_divide(df['total_price'].sum(), df['boxes'].sum())))
+    
+    st.divider()
+    
+    # Only ship one page to the browser; the export below still gets every row
+    page_count = max(1, -(-len(df) // SALES_PAGE_SIZE))
+    page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1, key="report_page")
+    offset = (int(page) - 1) * SALES_PAGE_SIZE
+    st.dataframe(df[['dt', 'Vendor', 'fruit', 'boxes', 'total_price']].iloc[offset:offset + SALES_PAGE_SIZE],
+                 use_container_width=True, hide_index=True,
+                 column_config={
+                     'boxes': st.column_config.NumberColumn(),
+                     'total_price': st.column_config.NumberColumn(format="₹%.2f")
+                 })
+    
+    # A callable defers building the workbook until the button is clicked
+    st.download_button("📥 Download", data=lambda: export_to_excel(df), file_name=f"sales_{start}_{end}.xlsx", 
+                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+
+@st.fragment
+def daily_panel():
+    """Totals for one day; changing the date reruns only this fragment"""
+    selected = st.date_input("Date", value=date.today(), key="daily_date")
+    
+    try:
+        summary = get_daily_summary(selected)
+    except (APIError, httpx.HTTPError) as e:
+        st.error(f"Error: {e}")
+        return
+    
+    if summary['num_transactions'] > 0:
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Sales", format_currency(summary['total_sales']))
+        col2.metric("Boxes", str(summary['boxes_sold']))
+        col3.metric("Payments", format_currency(summary['payments_received']))
+    else:
+        st.info("No transactions")
 
 # ==================== MAIN APP ====================
 st.set_page_config(
@@ -511,9 +827,12 @@ if auth_status:
         st.write(f'**{name}**')
         if username == 'admin':
             st.caption("🔑 Administrator")
-            counts = get_request_counts()
-            if counts['pending'] > 0:
-                st.warning(f"⏳ {counts['pending']} pending")
+            try:
+                counts = get_request_counts()
+                if counts['pending'] > 0:
+                    st.warning(f"⏳ {counts['pending']} pending")
+            except (APIError, httpx.HTTPError) as e:
+                st.error(f"Requests unavailable: {e}")
         else:
             st.caption("👥 User")
         
@@ -521,10 +840,20 @@ if auth_status:
         st.divider()
         
         with st.spinner("Loading..."):
-            stock = get_current_stock()
-            st.metric("📦 Stock", f"{sum(stock.values())} boxes" if stock else "0")
+            # Independent reads: on a cold cache they overlap instead of queuing.
+            # Workers get the script context so the cached calls run as usual.
+            ctx = get_script_run_ctx()
+            with ThreadPoolExecutor(max_workers=2, initializer=add_script_run_ctx, initargs=(None, ctx)) as pool:
+                stock_future = pool.submit(get_current_stock)
+                summary_future = pool.submit(vendor_summary_table)
+            
+            try:
+                stock = stock_future.result()
+                st.metric("📦 Stock", f"{sum(stock.values())} boxes" if stock else "0")
+            except (APIError, httpx.HTTPError) as e:
+                st.error(f"Stock unavailable: {e}")
             
-            summary = vendor_summary_table()
+            summary = summary_future.result()
             if not summary.empty:
                 st.metric("💵 Dues", format_currency(summary['net_due'].sum()))
         
@@ -533,6 +862,8 @@ if auth_status:
         
         if st.button("🔄 Refresh", use_container_width=True):
             st.cache_data.clear()
+            list_vendors.clear()
+            vendor_summary_table.clear()
             st.rerun()
     
     st.title("🍎 DBF Management System")
@@ -541,6 +872,10 @@ if auth_status:
     tabs = st.tabs(["📋 Vendors", "📦 Stock", "💰 Sell", "↩️ box Returns", "💵 Payments", 
                     "✏️ Edit Sales", "📊 Dues", "📈 Reports", "📅 Daily"])
     
+    # Shared by the Sell, Returns and Payments forms
+    vendors_df = list_vendors()
+    vendor_id_by_name = vendor_ids_by_name()
+    
     # TAB 0: VENDORS
     with tabs[0]:
         st.header("Vendors")
@@ -556,13 +891,13 @@ if auth_status:
                         try:
                             supabase.table("vendors").insert({"name": vname, "contact": vcontact}).execute()
                             list_vendors.clear()
+                            vendor_ids_by_name.clear()
                             st.success("✓")
                             st.rerun()
                         except Exception as e:
                             st.error(f"Error: {e}")
         
         with col2:
-            vendors_df = list_vendors()
             if not vendors_df.empty:
                 st.dataframe(vendors_df, use_container_width=True, hide_index=True)
             else:
@@ -585,21 +920,30 @@ if auth_status:
                         st.rerun()
         
         with col2:
-            stock = get_current_stock()
+            try:
+                stock = get_current_stock()
+            except (APIError, httpx.HTTPError) as e:
+                st.error(f"Error: {e}")
+                stock = None
             if stock:
-                stock_df = pd.DataFrame(list(stock.items()), columns=['Fruit', 'Boxes'])
-                st.dataframe(stock_df, use_container_width=True, hide_index=True)
-            else:
+                st.dataframe({'Fruit': list(stock), 'Boxes': list(stock.values())},
+                             use_container_width=True, hide_index=True)
+            elif stock is not None:
                 st.info("No stock")
     
     # TAB 2: SELL
     with tabs[2]:
         st.header("Record Sale")
         
-        vendors_df = list_vendors()
-        fruits = list_fruits()
+        try:
+            fruits = list_fruits()
+            stock_error = None
+        except (APIError, httpx.HTTPError) as e:
+            fruits, stock_error = [], e
         
-        if vendors_df.empty or not fruits:
+        if stock_error:
+            st.error(f"Error loading stock: {stock_error}")
+        elif vendors_df.empty or not fruits:
             st.warning("Add vendors and stock first")
         else:
             with st.form("sell_form", clear_on_submit=True):
@@ -608,7 +952,7 @@ if auth_status:
                 with col1:
                     sdate = st.date_input("Date", value=date.today())
                     vendor = st.selectbox("Vendor", vendors_df['name'].tolist())
-                    vid = int(vendors_df[vendors_df['name'] == vendor]['id'].iloc[0])
+                    vid = vendor_id_by_name[vendor]
                 
                 with col2:
                     fruit = st.selectbox("Fruit", fruits)
@@ -627,7 +971,6 @@ if auth_status:
     with tabs[3]:
         st.header("Record Returns")
         
-        vendors_df = list_vendors()
         if vendors_df.empty:
             st.warning("Add vendors first")
         else:
@@ -637,7 +980,7 @@ if auth_status:
                 with col1:
                     rdate = st.date_input("Date", value=date.today())
                     vendor = st.selectbox("Vendor", vendors_df['name'].tolist())
-                    vid = int(vendors_df[vendors_df['name'] == vendor]['id'].iloc[0])
+                    vid = vendor_id_by_name[vendor]
                 
                 with col2:
                     rfruit = st.text_input("Fruit", value="APPLE")
@@ -654,7 +997,6 @@ if auth_status:
     with tabs[4]:
         st.header("Payments")
         
-        vendors_df = list_vendors()
         if vendors_df.empty:
             st.warning("Add vendors first")
         else:
@@ -663,7 +1005,7 @@ if auth_status:
             with col1:
                 pdate = st.date_input("Date", value=date.today(), key="pdate")
                 vendor = st.selectbox("Vendor", vendors_df['name'].tolist(), key="pvendor")
-                vid = int(vendors_df[vendors_df['name'] == vendor]['id'].iloc[0])
+                vid = vendor_id_by_name[vendor]
                 
                 summary = vendor_summary_table()
                 if not summary.empty:
@@ -684,13 +1026,17 @@ if auth_status:
             with col2:
                 st.subheader("Recent")
                 try:
-                    payments = supabase.table("payments").select("*").order("dt", desc=True).limit(20).execute()
-                    if payments and hasattr(payments, 'data') and payments.data:
-                        df = pd.DataFrame(payments.data)
-                        vendor_map = dict(zip(vendors_df['id'], vendors_df['name']))
-                        df['Vendor'] = df['vendor_id'].map(vendor_map)
-                        st.dataframe(df[['dt', 'Vendor', 'amount']], use_container_width=True, hide_index=True)
-                except:
+                    payments_df = recent_payments()
+                    payments_error = None
+                except (APIError, httpx.HTTPError) as e:
+                    payments_df, payments_error = pd.DataFrame(), e
+                
+                if payments_error:
+                    st.error(f"Error loading payments: {payments_error}")
+                elif not payments_df.empty:
+                    st.dataframe(payments_df, use_container_width=True, hide_index=True,
+                                 column_config={'amount': st.column_config.NumberColumn(format="₹%.2f")})
+                else:
                     st.info("No payments")
     
     # TAB 5: EDIT SALES (FIXED WORKFLOW)
@@ -700,11 +1046,14 @@ if auth_status:
         if username == 'admin':
             st.success("🔑 Admin Mode")
             
-            counts = get_request_counts()
-            col1, col2, col3 = st.columns(3)
-            col1.metric("⏳ Pending", counts['pending'])
-            col2.metric("✅ Approved", counts['approved'])
-            col3.metric("❌ Rejected", counts['rejected'])
+            try:
+                counts = get_request_counts()
+                col1, col2, col3 = st.columns(3)
+                col1.metric("⏳ Pending", counts['pending'])
+                col2.metric("✅ Approved", counts['approved'])
+                col3.metric("❌ Rejected", counts['rejected'])
+            except (APIError, httpx.HTTPError) as e:
+                st.error(f"Error loading request counts: {e}")
             
             st.divider()
             
@@ -713,20 +1062,26 @@ if auth_status:
             with admin_tabs[0]:
                 st.subheader("📋 Pending Requests")
                 
-                pending = get_pending_requests("pending")
+                try:
+                    pending = get_pending_requests("pending", "id, sale_id, requester_name, note, current_data, requested_data")
+                    pending_error = None
+                except (APIError, httpx.HTTPError) as e:
+                    pending, pending_error = pd.DataFrame(), e
                 
-                if pending.empty:
+                if pending_error:
+                    st.error(f"Error loading requests: {pending_error}")
+                elif pending.empty:
                     st.success("✅ No pending requests")
                 else:
                     st.warning(f"⏳ {len(pending)} request(s) awaiting review")
                     
-                    for _, req in pending.iterrows():
-                        with st.expander(f"🔔 Request #{req['id']} - Sale #{req['sale_id']} - By {req['requester_name']}"):
+                    for req in pending.itertuples(index=False):
+                        with st.expander(f"🔔 Request #{req.id} - Sale #{req.sale_id} - By {req.requester_name}"):
                             
-                            current = json.loads(req['current_data'])
-                            requested = json.loads(req['requested_data'])
+                            current = json.loads(req.current_data)
+                            requested = json.loads(req.requested_data)
                             
-                            st.info(f"**Reason:** {req.get('note', 'N/A')}")
+                            st.info(f"**Reason:** {getattr(req, 'note', 'N/A')}")
                             
                             col1, col2 = st.columns(2)
                             
@@ -750,173 +1105,103 @@ if auth_status:
                             col_a, col_b = st.columns(2)
                             
                             with col_a:
-                                with st.form(f"approve_{req['id']}", clear_on_submit=True):
+                                with st.form(f"approve_{req.id}", clear_on_submit=True):
                                     st.markdown("#### ✅ Approve")
-                                    comment = st.text_area("Comment", key=f"ca{req['id']}")
+                                    comment = st.text_area("Comment", key=f"ca{req.id}")
                                     
                                     if st.form_submit_button("✅ Approve & Apply", type="primary", use_container_width=True):
                                         with st.spinner("Applying..."):
-                                            if approve_change_request(req['id'], username, comment):
+                                            if approve_change_request(req.id, username, comment):
                                                 st.success("✅ Approved! Changes applied.")
                                                 st.balloons()
                                                 st.rerun()
                             
                             with col_b:
-                                with st.form(f"reject_{req['id']}", clear_on_submit=True):
+                                with st.form(f"reject_{req.id}", clear_on_submit=True):
                                     st.markdown("#### ❌ Reject")
-                                    reason = st.text_area("Reason *", key=f"cr{req['id']}")
+                                    reason = st.text_area("Reason *", key=f"cr{req.id}")
                                     
                                     if st.form_submit_button("❌ Reject", use_container_width=True):
-                                        if reason.strip() and reject_change_request(req['id'], username, reason):
+                                        if not reason.strip():
+                                            st.error("Reason required")
+                                        elif reject_change_request(req.id, username, reason):
                                             st.success("✅ Rejected")
                                             st.rerun()
-                                        else:
-                                            st.error("Reason required")
             
             with admin_tabs[1]:
-                st.subheader("Direct Edit")
-                st.warning("⚠️ Immediate changes")
-                
-                col1, col2 = st.columns(2)
-                start = col1.date_input("From", value=date.today().replace(day=1), key="admin_direct_start")
-                end = col2.date_input("To", value=date.today(), key="admin_direct_end")
-                
-                if st.button("Load", key="admin_load"):
-                    sales_df = get_sales_for_editing(start.isoformat(), end.isoformat())
-                    if not sales_df.empty:
-                        st.session_state.edited_sales = sales_df
-                        st.session_state.edit_mode = True
-                    else:
-                        st.warning("No sales")
-                
-                if st.session_state.edit_mode and not st.session_state.edited_sales.empty:
-                    edit_cols = ['id', 'dt', 'vendor_name', 'fruit', 'boxes', 'price_per_box', 'box_deposit_per_box']
-                    display_df = st.session_state.edited_sales[edit_cols].copy()
-                    
-                    edited_df = st.data_editor(
-                        display_df,
-                        use_container_width=True,
-                        num_rows="fixed",
-                        hide_index=True,
-                        key="admin_editor",
-                        column_config={
-                            'id': st.column_config.NumberColumn('ID', disabled=True),
-                            'dt': st.column_config.TextColumn('Date', disabled=True),
-                            'vendor_name': st.column_config.TextColumn('Vendor', disabled=True)
-                        }
-                    )
-                    
-                    if st.button("💾 Save", type="primary", key="admin_save"):
-                        st.success("Saved")
-                        st.session_state.edit_mode = False
-                        st.rerun()
+                admin_direct_edit()
             
             with admin_tabs[2]:
                 st.subheader("History")
-                approved = get_pending_requests("approved")
-                rejected = get_pending_requests("rejected")
-                
-                if not approved.empty:
-                    st.markdown("### ✅ Approved")
-                    st.dataframe(approved[['id', 'requester_name', 'sale_id', 'reviewed_by']], 
-                               use_container_width=True, hide_index=True)
                 
-                if not rejected.empty:
-                    st.markdown("### ❌ Rejected")
-                    st.dataframe(rejected[['id', 'requester_name', 'sale_id', 'reviewed_by', 'admin_comment']], 
-                               use_container_width=True, hide_index=True)
+                # Tab bodies always run, so only fetch history when asked for
+                if st.checkbox("Show history", key="admin_show_history"):
+                    # History tables don't show the JSON payloads, so don't fetch them
+                    history_cols = "id, requester_name, sale_id, reviewed_by, admin_comment"
+                    try:
+                        approved = get_pending_requests("approved", history_cols)
+                        rejected = get_pending_requests("rejected", history_cols)
+                        history_error = None
+                    except (APIError, httpx.HTTPError) as e:
+                        approved, rejected, history_error = pd.DataFrame(), pd.DataFrame(), e
+                    
+                    if history_error:
+                        st.error(f"Error loading history: {history_error}")
+                    elif approved.empty and rejected.empty:
+                        st.info("No reviewed requests")
+                    
+                    if not approved.empty:
+                        st.markdown("### ✅ Approved")
+                        st.dataframe(approved[['id', 'requester_name', 'sale_id', 'reviewed_by']], 
+                                   use_container_width=True, hide_index=True)
+                    
+                    if not rejected.empty:
+                        st.markdown("### ❌ Rejected")
+                        st.dataframe(rejected[['id', 'requester_name', 'sale_id', 'reviewed_by', 'admin_comment']], 
+                                   use_container_width=True, hide_index=True)
         
         else:
             st.info("📝 Submit requests for admin approval")
             st.warning("⚠️ Changes apply ONLY after admin approval")
             
             try:
-                user_reqs = supabase.table("change_requests").select("*").eq("requested_by", username).order("request_date", desc=True).limit(10).execute()
-                if user_reqs and hasattr(user_reqs, 'data') and user_reqs.data:
-                    df = pd.DataFrame(user_reqs.data)
-                    
-                    col1, col2, col3 = st.columns(3)
-                    col1.metric("⏳ Pending", len(df[df['status']=='pending']))
-                    col2.metric("✅ Approved", len(df[df['status']=='approved']))
-                    col3.metric("❌ Rejected", len(df[df['status']=='rejected']))
-                    
-                    st.divider()
+                df = get_user_requests(username)
+            except (APIError, httpx.HTTPError) as e:
+                st.error(f"Error loading your requests: {e}")
+                df = pd.DataFrame()
+            
+            if not df.empty:
+                status_counts = df['status'].value_counts()
+                col1, col2, col3 = st.columns(3)
+                col1.metric("⏳ Pending", int(status_counts.get('pending', 0)))
+                col2.metric("✅ Approved", int(status_counts.get('approved', 0)))
+                col3.metric("❌ Rejected", int(status_counts.get('rejected', 0)))
+                
+                st.divider()
+                
+                if not df.empty:
+                    st.subheader("📜 My Requests")
                     
-                    if not df.empty:
-                        st.subheader("📜 My Requests")
+                    for req in df.head(5).itertuples(index=False):
+                        status_icon = {'pending': '⏳', 'approved': '✅', 'rejected': '❌'}.get(req.status, '❓')
                         
-                        for _, req in df.head(5).iterrows():
-                            status_icon = {'pending': '⏳', 'approved': '✅', 'rejected': '❌'}.get(req['status'], '❓')
+                        with st.expander(f"{status_icon} #{req.id} - Sale {req.sale_id} - {req.status.upper()}"):
+                            st.caption(f"Submitted: {req.request_date}")
+                            st.write(f"**Note:** {getattr(req, 'note', 'N/A')}")
                             
-                            with st.expander(f"{status_icon} #{req['id']} - Sale {req['sale_id']} - {req['status'].upper()}"):
-                                st.caption(f"Submitted: {req['request_date']}")
-                                st.write(f"**Note:** {req.get('note', 'N/A')}")
-                                
-                                if req['status'] == 'pending':
-                                    st.info("⏳ Awaiting approval...")
-                                elif req['status'] == 'approved':
-                                    st.success(f"✅ Approved by {req.get('reviewed_by', 'Admin')}")
-                                    if req.get('admin_comment'):
-                                        st.write(f"**Comment:** {req['admin_comment']}")
-                                elif req['status'] == 'rejected':
-                                    st.error(f"❌ Rejected by {req.get('reviewed_by', 'Admin')}")
-                                    st.write(f"**Reason:** {req.get('admin_comment', 'N/A')}")
-            except:
-                pass
+                            if req.status == 'pending':
+                                st.info("⏳ Awaiting approval...")
+                            elif req.status == 'approved':
+                                st.success(f"✅ Approved by {getattr(req, 'reviewed_by', 'Admin')}")
+                                if getattr(req, 'admin_comment', None):
+                                    st.write(f"**Comment:** {req.admin_comment}")
+                            elif req.status == 'rejected':
+                                st.error(f"❌ Rejected by {getattr(req, 'reviewed_by', 'Admin')}")
+                                st.write(f"**Reason:** {getattr(req, 'admin_comment', 'N/A')}")
             
             st.divider()
             
-            col1, col2 = st.columns(2)
-            start = col1.date_input("From", value=date.today().replace(day=1), key="user_start")
-            end = col2.date_input("To", value=date.today(), key="user_end")
-            
-            if st.button("Load", key="user_load"):
-                sales_df = get_sales_for_editing(start.isoformat(), end.isoformat())
-                if not sales_df.empty:
-                    st.session_state.user_edit_sales = sales_df
-                else:
-                    st.warning("No sales")
-            
-            if 'user_edit_sales' in st.session_state and not st.session_state.user_edit_sales.empty:
-                st.warning("⚠️ Changes require approval")
-                
-                edit_cols = ['id', 'dt', 'vendor_name', 'fruit', 'boxes', 'price_per_box', 'box_deposit_per_box']
-                display_df = st.session_state.user_edit_sales[edit_cols].copy()
-                
-                edited_df = st.data_editor(
-                    display_df,
-                    use_container_width=True,
-                    hide_index=True,
-                    key="user_editor",
-                    column_config={
-                        'id': st.column_config.NumberColumn('ID', disabled=True),
-                        'dt': st.column_config.TextColumn('Date', disabled=True),
-                        'vendor_name': st.column_config.TextColumn('Vendor', disabled=True)
-                    }
-                )
-                
-                reason = st.text_area("Reason *", key="user_reason")
-                
-                if st.button("📤 Submit", type="primary", key="user_submit"):
-                    if not reason.strip():
-                        st.error("Reason required")
-                    else:
-                        submitted = 0
-                        for idx in range(len(st.session_state.user_edit_sales)):
-                            orig = st.session_state.user_edit_sales.iloc[idx][edit_cols]
-                            edit = edited_df.iloc[idx]
-                            
-                            if not orig.equals(edit):
-                                current = orig.to_dict()
-                                requested = edit.to_dict()
-                                
-                                if submit_change_request(int(edit['id']), current, requested, username, name, reason):
-                                    submitted += 1
-                        
-                        if submitted > 0:
-                            st.success(f"✓ Submitted {submitted} request(s)")
-                            del st.session_state.user_edit_sales
-                            st.rerun()
+            user_edit_requests()
     
     # TAB 6: DUES
     with tabs[6]:
@@ -926,69 +1211,31 @@ if auth_status:
         if summary.empty:
             st.info("No transactions")
         else:
+            money_cols = ['total_sales', 'payments', 'net_due', 'net_deposits_held']
+            totals = summary[money_cols].sum()
+            
             col1, col2, col3, col4 = st.columns(4)
-            col1.metric("Sales", format_currency(summary['total_sales'].sum()))
-            col2.metric("Paid", format_currency(summary['payments'].sum()))
-            col3.metric("Due", format_currency(summary['net_due'].sum()))
-            col4.metric("Deposits", format_currency(summary['net_deposits_held'].sum()))
+            col1.metric("Sales", format_currency(totals['total_sales']))
+            col2.metric("Paid", format_currency(totals['payments']))
+            col3.metric("Due", format_currency(totals['net_due']))
+            col4.metric("Deposits", format_currency(totals['net_deposits_held']))
             
             st.divider()
             
-            display = summary.copy()
-            for col in ['total_sales', 'payments', 'net_due', 'net_deposits_held']:
-                display[col] = display[col].apply(format_currency)
-            
-            st.dataframe(display[['vendor_name', 'total_sales', 'payments', 'net_due', 'net_deposits_held']], 
-                        use_container_width=True, hide_index=True)
+            # Keep the columns numeric and let the frontend format them
+            st.dataframe(summary[['vendor_name'] + money_cols], 
+                        use_container_width=True, hide_index=True,
+                        column_config={c: st.column_config.NumberColumn(format="₹%.2f") for c in money_cols})
     
     # TAB 7: REPORTS
     with tabs[7]:
         st.header("Reports")
-        
-        col1, col2 = st.columns(2)
-        start = col1.date_input("From", value=date.today().replace(day=1), key="report_start")
-        end = col2.date_input("To", value=date.today(), key="report_end")
-        
-        try:
-            sales = supabase.table("sales").select("*").gte("dt", start.isoformat()).lte("dt", end.isoformat()).execute()
-            if sales and hasattr(sales, 'data') and sales.data:
-                df = pd.DataFrame(sales.data)
-                
-                col1, col2, col3 = st.columns(3)
-                col1.metric("Revenue", format_currency(df['total_price'].sum()))
-                col2.metric("Boxes", str(df['boxes'].sum()))
-                col3.metric("Avg", format_currency(safe_divide(df['total_price'].sum(), df['boxes'].sum())))
-                
-                st.divider()
-                
-                vendors_df = list_vendors()
-                vendor_map = dict(zip(vendors_df['id'], vendors_df['name']))
-                df['Vendor'] = df['vendor_id'].map(vendor_map)
-                
-                st.dataframe(df[['dt', 'Vendor', 'fruit', 'boxes', 'total_price']], use_container_width=True, hide_index=True)
-                
-                excel = export_to_excel(df)
-                st.download_button("📥 Download", data=excel, file_name=f"sales_{start}_{end}.xlsx", 
-                                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-            else:
-                st.info("No sales")
-        except Exception as e:
-            st.error(f"Error: {e}")
+        reports_panel()
     
     # TAB 8: DAILY
     with tabs[8]:
         st.header("Daily Summary")
-        
-        selected = st.date_input("Date", value=date.today(), key="daily_date")
-        
-        summary = get_daily_summary(selected)
-        if summary and summary['num_transactions'] > 0:
-            col1, col2, col3 = st.columns(3)
-            col1.metric("Sales", format_currency(summary['total_sales']))
-            col2.metric("Boxes", str(summary['boxes_sold']))
-            col3.metric("Payments", format_currency(summary['payments_received']))
-        else:
-            st.info("No transactions")
+        daily_panel()
     
     st.divider()
     st.caption(f"🍎 DBF v6.1 - {name} ({username})")